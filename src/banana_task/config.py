@@ -1,6 +1,6 @@
 # src/mytaskmanager/config.py
 import os
-import json
+import orjson
 
 DEFAULT_CONFIG = {
     "db_url": "sqlite:///my_tasks.db",
@@ -11,6 +11,10 @@ DEFAULT_CONFIG = {
     "log_level": "INFO",  # Could be DEBUG/INFO/WARNING/ERROR/CRITICAL
 }
 
+# Parsed config file, reused until the file's mtime changes
+_CONFIG_CACHE = None
+_CONFIG_MTIME = None
+
 def get_config_file() -> str:
     """
     Returns the path to the user's config file, e.g. ~/.mytaskmanager/config.json
@@ -23,23 +27,34 @@ def get_config_file() -> str:
 def load_config() -> dict:
     """
     Loads config from disk if present, otherwise returns DEFAULT_CONFIG.
+    The file is only re-parsed when its modification time changes.
     """
+    global _CONFIG_CACHE, _CONFIG_MTIME
     config_path = get_config_file()
-    if os.path.exists(config_path):
-        with open(config_path, "r", encoding="utf-8") as f:
-            user_config = json.load(f)
-        # Merge user_config onto the defaults
-        merged = {**DEFAULT_CONFIG, **user_config}
-        return merged
-    else:
+    try:
+        mtime = os.stat(config_path).st_mtime_ns
+    except FileNotFoundError:
         return dict(DEFAULT_CONFIG)
 
+    if _CONFIG_CACHE is None or mtime != _CONFIG_MTIME:
+        with open(config_path, "rb") as f:
+            user_config = orjson.loads(f.read())
+        # Merge user_config onto the defaults
+        _CONFIG_CACHE = {**DEFAULT_CONFIG, **user_config}
+        _CONFIG_MTIME = mtime
+    return dict(_CONFIG_CACHE)
+
 def save_config(new_config: dict) -> None:
     """
     Saves the given config dictionary to disk, merging with the defaults.
     """
+    global _CONFIG_CACHE, _CONFIG_MTIME
     config = load_config()
     config.update(new_config)  # update existing or default
     config_path = get_config_file()
-    with open(config_path, "w", encoding="utf-8") as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    with open(config_path, "wb") as f:
+        f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+    # We just wrote it, so there's no need to parse it again on the next load
+    _CONFIG_CACHE = config
+    _CONFIG_MTIME = os.stat(config_path).st_mtime_ns
+
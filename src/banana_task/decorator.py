@@ -1,20 +1,32 @@
 # mytaskmanager/decorators.py
 
-import hashlib
-import json
+import atexit
+import copy
 import logging
 import inspect
+import json
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timezone
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
 
 from .config import load_config
 from .model import Base, Task, TaskStatus
-from .output import JSONOutputManager
-from .exception import TaskInProgressError, TaskFailedError
+from .output import JSONOutputManager, encode_parameters
+from .worker import StorageWorker
+from .exception import TaskInProgressError, TaskFailedError, TaskKeyCollisionError
 
 ############################################
 #           Module-Level Globals           #
@@ -37,13 +49,281 @@ logging.basicConfig(level=logging.INFO)
 logger.setLevel(level)
 
 # 3) Create the global SQLAlchemy engine & session factory
-engine = create_engine(DB_URL, echo=False)
+db_url = make_url(DB_URL)
+if db_url.get_backend_name() == "sqlite":
+    # SQLite connections are cheap to open, and a shared pooled connection only
+    # serializes threads: give each session its own (an in-memory DB must keep one)
+    in_memory = db_url.database in (None, "", ":memory:")
+    engine = create_engine(
+        DB_URL,
+        echo=False,
+        poolclass=StaticPool if in_memory else NullPool,
+        connect_args={"check_same_thread": False, "timeout": 60},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragma(dbapi_conn, _connection_record):
+        """
+        Tune every new SQLite connection: WAL so readers don't block the writer,
+        relaxed fsync, a 64MB page cache and a generous lock wait.
+        """
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA busy_timeout=60000")
+        cursor.close()
+else:
+    # Network databases: keep a pool of warm connections. LIFO reuses the most
+    # recently returned (hottest) connection; pre-ping/recycle drop stale ones.
+    engine_kwargs = {}
+    if db_url.get_dialect().driver == "psycopg2":
+        # Send the storage worker's batched UPDATEs as a few execute_batch
+        # round-trips instead of one per row
+        engine_kwargs["executemany_mode"] = "values_plus_batch"
+    engine = create_engine(
+        DB_URL,
+        echo=False,
+        pool_size=10,
+        max_overflow=20,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+        **engine_kwargs,
+    )
+
 Base.metadata.create_all(engine)
+# create_all() skips tables that already exist, so add any newer indexes explicitly
+for index in Task.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
 SessionFactory = sessionmaker(bind=engine, expire_on_commit=False)
 
+# INSERT ... ON CONFLICT DO NOTHING, for the backends that support it
+_insert_ignore = {"postgresql": pg_insert, "sqlite": sqlite_insert}.get(engine.dialect.name)
+
 # 4) Reuse a single JSONOutputManager
 output_mgr = JSONOutputManager(OUTPUT_DIR)
 
+# 5) In-process LRUs: completed results keyed by (task_name, param_hash), plus
+#    raw calls mapped to that key so repeat calls can skip binding and hashing.
+#    Results go in and out as deep copies, so a caller mutating the object it
+#    got back can't change what later cache hits return.
+RESULT_CACHE_SIZE = 1024
+_result_cache = OrderedDict()
+_call_key_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_MISSING = object()
+
+# 6) Terminal status updates are committed by a background thread; anything
+#    still queued is flushed before the interpreter exits. Threads don't survive
+#    fork(), so a forked child (e.g. a multiprocessing worker) starts its own.
+#    multiprocessing children leave through os._exit() and skip atexit, so
+#    theirs is flushed by a multiprocessing finalizer instead.
+STORAGE_FLUSH_TIMEOUT = 30  # seconds to wait for queued updates to be committed
+
+
+def _start_storage_worker():
+    """
+    Create and start the storage worker for the current process.
+    """
+    global storage_worker
+    storage_worker = StorageWorker(SessionFactory)
+    storage_worker.start()
+
+
+def _flush_storage_worker():
+    storage_worker.flush(STORAGE_FLUSH_TIMEOUT)
+
+
+def _reinit_after_fork():
+    """
+    Runs in a forked child: the parent's worker thread, pooled connections and
+    any lock another thread held at fork time are unusable there.
+    """
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    engine.dispose(close=False)
+    _start_storage_worker()
+
+
+def _register_child_flush(_module):
+    """
+    Runs in a multiprocessing child once it has cleared the finalizers it
+    inherited: flush queued updates when the child's process exits.
+    """
+    multiprocessing.util.Finalize(None, _flush_storage_worker, exitpriority=10)
+
+
+_start_storage_worker()
+atexit.register(_flush_storage_worker)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+multiprocessing.util.register_after_fork(sys.modules[__name__], _register_child_flush)
+
+
+############################################
+#           Helpers                        #
+############################################
+
+def _make_param_binder(func):
+    """
+    Introspect `func` once and return a callable (args, kwargs) -> param_dict
+    equivalent to binding the call against the signature and applying defaults.
+
+    Plain signatures (no *args, **kwargs or positional-only parameters) take a
+    fast path that zips positional arguments onto the precomputed parameter
+    names; anything unusual falls back to `Signature.bind`, which also raises
+    the usual TypeError for invalid calls.
+    """
+    sig = inspect.signature(func)
+    params = sig.parameters
+    all_names = frozenset(params)
+    positional_names = tuple(
+        name for name, p in params.items()
+        if p.kind is inspect.Parameter.POSITIONAL_OR_KEYWORD
+    )
+    defaults = {
+        name: p.default for name, p in params.items()
+        if p.default is not inspect.Parameter.empty
+    }
+    use_fast_path = not any(
+        p.kind in (
+            inspect.Parameter.POSITIONAL_ONLY,
+            inspect.Parameter.VAR_POSITIONAL,
+            inspect.Parameter.VAR_KEYWORD,
+        )
+        for p in params.values()
+    )
+
+    def bind(args, kwargs):
+        if use_fast_path and len(args) <= len(positional_names):
+            param_dict = {**defaults, **dict(zip(positional_names, args)), **kwargs}
+            duplicated = kwargs and any(n in kwargs for n in positional_names[:len(args)])
+            if param_dict.keys() == all_names and not duplicated:
+                return param_dict
+
+        bound_args = sig.bind(*args, **kwargs)
+        bound_args.apply_defaults()
+        # Already a fresh mapping owned by bound_args; no need to copy it
+        return bound_args.arguments
+
+    return bind
+
+
+def _utcnow() -> datetime:
+    """
+    Current UTC time as a naive datetime, matching the DateTime columns.
+    Replaces datetime.utcnow(), which is deprecated.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _insert_task(session, values: dict) -> bool:
+    """
+    Insert a new task record, tolerating a concurrent insert of the same key.
+    Returns True if this call created the record, False if it already existed.
+    """
+    if _insert_ignore is not None:
+        stmt = _insert_ignore(Task).values(**values).on_conflict_do_nothing(
+            index_elements=["task_name", "parameters_hash"]
+        )
+        created = session.execute(stmt).rowcount == 1
+        session.commit()
+        return created
+
+    # Other backends: plain INSERT, treating a key conflict as "someone else won"
+    session.add(Task(**values))
+    try:
+        session.commit()
+        return True
+    except IntegrityError:
+        session.rollback()
+        return False
+
+
+# Argument types a raw call key may hold; containers are left to the full path,
+# since e.g. (1,) == (True,) == (1.0,) while their parameter JSON differs
+_CALL_KEY_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+def _call_key_part(value):
+    """
+    Key one argument by its exact type and value. Floats are keyed by repr, so
+    values that compare equal but encode differently (0.0 / -0.0) stay distinct.
+    Raises TypeError for any other type.
+    """
+    cls = type(value)
+    if cls is float:
+        return cls, repr(value)
+    if cls in _CALL_KEY_TYPES:
+        return cls, value
+    raise TypeError(cls)
+
+
+def _make_call_key(func, args, kwargs):
+    """
+    Build a hashable key for the raw call, or None unless every argument is a
+    plain str/int/float/bool/None. Argument types are part of the key so that
+    e.g. f(1), f(True) and f(1.0) stay distinct.
+    """
+    try:
+        return (
+            func,
+            tuple(_call_key_part(a) for a in args),
+            tuple(sorted((k, _call_key_part(v)) for k, v in kwargs.items())),
+        )
+    except TypeError:
+        return None
+
+
+def _cache_get(cache, key):
+    """
+    Return the entry for `key` in the given in-process LRU, or _MISSING.
+    """
+    with _cache_lock:
+        if key not in cache:
+            return _MISSING
+        cache.move_to_end(key)
+        return cache[key]
+
+
+def _cache_put(cache, key, value) -> None:
+    """
+    Store `value` under `key`, evicting the least recently used entry if full.
+    """
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > RESULT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def _same_parameters(stored, expected) -> bool:
+    """
+    Compare decoded parameter values, treating NaN as equal to NaN. Numbers
+    compare by value, so e.g. 1e16 or -0.0 read back from a PostgreSQL JSONB
+    numeric (as 10000000000000000 / 0) still match.
+    """
+    if isinstance(stored, dict) and isinstance(expected, dict):
+        return stored.keys() == expected.keys() and all(
+            _same_parameters(stored[k], expected[k]) for k in stored
+        )
+    if isinstance(stored, list) and isinstance(expected, list):
+        return len(stored) == len(expected) and all(map(_same_parameters, stored, expected))
+    if stored != stored and expected != expected:  # both NaN
+        return True
+    return stored == expected
+
+
+def _cache_discard(cache, key) -> None:
+    """
+    Drop `key` from the given in-process LRU (e.g. the task failed or was re-run).
+    """
+    with _cache_lock:
+        cache.pop(key, None)
+
 
 ############################################
 #           The Decorator                  #
@@ -62,162 +342,205 @@ def task(use_cache: bool = None, skip_if_in_progress: bool = None):
     """
 
     def decorator(func):
+        bind_params = _make_param_binder(func)
+        task_name = func.__name__
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            logger.info(f"=== [Project: {PROJECT_NAME}] Starting '{func.__name__}' ===")
+            logger.info("=== [Project: %s] Starting '%s' ===", PROJECT_NAME, task_name)
 
             # Resolve the effective caching/skipping policy:
             # If user didn't pass them, fallback to the global config values
             effective_use_cache = USE_CACHE if use_cache is None else use_cache
             effective_skip_in_progress = SKIP_IF_IN_PROGRESS if skip_if_in_progress is None else skip_if_in_progress
 
+            # 0. Cheapest lookup first: map the raw call straight to a cached result,
+            #    before any binding, serialization or hashing
+            call_key = None
+            if effective_use_cache:
+                call_key = _make_call_key(func, args, kwargs)
+                if call_key is not None:
+                    cache_key = _cache_get(_call_key_cache, call_key)
+                    if cache_key is not _MISSING:
+                        cached_result = _cache_get(_result_cache, cache_key)
+                        if cached_result is not _MISSING:
+                            logger.debug(
+                                "[%s] In-process cache hit for '%s' (raw call)", PROJECT_NAME, task_name
+                            )
+                            return copy.deepcopy(cached_result)
+
             # 1. Gather function parameters and turn them into a JSON string & hash
-            sig = inspect.signature(func)
-            bound_args = sig.bind(*args, **kwargs)
-            bound_args.apply_defaults()
-            param_dict = dict(bound_args.arguments)
-            param_json_str = json.dumps(param_dict, sort_keys=True)
-            param_hash = hashlib.md5(param_json_str.encode("utf-8")).hexdigest()
-            task_name = func.__name__
+            param_dict = bind_params(args, kwargs)
+            param_json, param_hash = encode_parameters(param_dict)
 
-            logger.debug(
-                f"[{PROJECT_NAME}] Function '{func.__name__}' called with "
-                f"raw params={param_dict}, json_str={param_json_str}, hash={param_hash}"
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "[%s] Function '%s' called with raw params=%s, json=%s, hash=%s",
+                    PROJECT_NAME, task_name, param_dict, param_json, param_hash,
+                )
 
-            # 2. Open a new DB session (reusing the global engine + session factory)
-            session = SessionFactory()
+            # Repeat calls within this process are served without touching the DB or disk
+            cache_key = (task_name, param_hash)
+            if effective_use_cache:
+                cached_result = _cache_get(_result_cache, cache_key)
+                if cached_result is not _MISSING:
+                    logger.debug(
+                        "[%s] In-process cache hit for '%s' | %s", PROJECT_NAME, task_name, param_dict
+                    )
+                    if call_key is not None:
+                        _cache_put(_call_key_cache, call_key, cache_key)
+                    return copy.deepcopy(cached_result)
+
+                # An output file on disk means the task completed before: no DB round-trip needed
+                cached_result = output_mgr.load_output(task_name, param_dict, param_hash)
+                if cached_result is not None:
+                    logger.info(
+                        "[%s] Cache hit! Returning cached result for '%s' | %s",
+                        PROJECT_NAME, task_name, param_dict,
+                    )
+                    _cache_put(_result_cache, cache_key, copy.deepcopy(cached_result))
+                    if call_key is not None:
+                        _cache_put(_call_key_cache, call_key, cache_key)
+                    return cached_result
+
+            # 2. Short-lived session (reusing the global engine + session factory):
+            #    find or create the record and claim it as RUNNING. It is closed
+            #    before the function runs, so no connection is held meanwhile.
+            if storage_worker.has_pending(cache_key):
+                # This task's last outcome is still queued; let it land before reading it
+                if not storage_worker.flush(STORAGE_FLUSH_TIMEOUT):
+                    logger.warning(
+                        "[%s] Queued updates for '%s' not committed after %ss; reading the DB as is.",
+                        PROJECT_NAME, task_name, STORAGE_FLUSH_TIMEOUT,
+                    )
 
-            try:
-                # 3. Query for existing Task record by (task_name, parameters_hash, parameters)
-                logger.debug(f"[{PROJECT_NAME}] Looking up existing task record in DB.")
-                existing_task = session.query(Task).filter_by(
-                    task_name=task_name,
-                    parameters_hash=param_hash,
-                    parameters=param_dict,
-                ).first()
+            with SessionFactory() as session:
+                # 3. Query for existing Task record by its primary key (task_name, parameters_hash)
+                logger.debug("[%s] Looking up existing task record in DB.", PROJECT_NAME)
+                existing_task = session.get(Task, (task_name, param_hash))
 
                 if existing_task:
-                    logger.debug(f"[{PROJECT_NAME}] Found existing task: status={existing_task.status}")
+                    logger.debug("[%s] Found existing task: status=%s", PROJECT_NAME, existing_task.status)
                 else:
-                    logger.debug(f"[{PROJECT_NAME}] No existing task found; attempting to create a new one.")
+                    logger.debug("[%s] No existing task found; attempting to create a new one.", PROJECT_NAME)
 
-                # If no existing task, create it
+                # If no existing task, create it directly in RUNNING state:
+                # one INSERT + commit instead of a CREATED insert followed by a RUNNING update
+                created_new = False
                 if not existing_task:
-                    new_task = Task(
+                    values = dict(
                         task_name=task_name,
                         parameters_hash=param_hash,
                         parameters=param_dict,
-                        status=TaskStatus.CREATED,
-                        creation_time=datetime.utcnow()
+                        status=TaskStatus.RUNNING,
+                        creation_time=_utcnow(),
                     )
-                    session.add(new_task)
-                    try:
-                        session.commit()
-                        existing_task = new_task
+                    created_new = _insert_task(session, values)
+                    if created_new:
+                        existing_task = Task(**values)
                         logger.info(
-                            f"[{PROJECT_NAME}] Created new task record: {task_name} | params={param_dict}"
+                            "[%s] Created new task record (RUNNING): %s | params=%s",
+                            PROJECT_NAME, task_name, param_dict,
                         )
-                    except IntegrityError:
+                    else:
                         # Another process or thread inserted the same key
-                        logger.debug(
-                            f"[{PROJECT_NAME}] IntegrityError - possible concurrency. "
-                            f"Rolling back and re-fetching the record."
-                        )
-                        session.rollback()
-                        existing_task = session.query(Task).filter_by(
-                            task_name=task_name,
-                            parameters_hash=param_hash,
-                            parameters=param_dict,
-                        ).one()
+                        existing_task = session.get(Task, (task_name, param_hash))
                         logger.info(
-                            f"[{PROJECT_NAME}] Task record already existed (concurrency), "
-                            f"fetched existing: {task_name} | {param_dict}"
+                            "[%s] Task record already existed (concurrency), fetched existing: %s | %s",
+                            PROJECT_NAME, task_name, param_dict,
                         )
 
-                # 4. Check if we should skip if it's already running
-                if effective_skip_in_progress and existing_task.status == TaskStatus.RUNNING:
+                # The lookup is by hash only; confirm the stored parameters really match
+                if not created_new and not _same_parameters(
+                    existing_task.parameters, json.loads(param_json)
+                ):
+                    msg = (
+                        f"[{PROJECT_NAME}] Task '{task_name}' params={param_dict} collide with "
+                        f"stored params={existing_task.parameters} (hash={param_hash})."
+                    )
+                    logger.error(msg)
+                    raise TaskKeyCollisionError(msg)
+
+                # 4. Check if we should skip if it's already running (by someone else)
+                if (
+                    effective_skip_in_progress
+                    and not created_new
+                    and existing_task.status == TaskStatus.RUNNING
+                ):
                     msg = (
                         f"[{PROJECT_NAME}] Task '{task_name}' (params={param_dict}) is RUNNING; "
                         "skip_if_in_progress=True → TaskInProgressError raised."
                     )
                     logger.warning(msg)
-                    session.close()
                     raise TaskInProgressError(msg)
 
-                # 5. If effective_use_cache and the task is completed, try to load from JSON
+                # 5. The output cache was already checked before opening the session
                 if effective_use_cache and existing_task.status == TaskStatus.COMPLETED:
-                    logger.debug(f"[{PROJECT_NAME}] Task is COMPLETED in DB, checking JSON cache.")
-                    cached_result = output_mgr.load_output(task_name, param_dict)
-                    if cached_result is not None:
-                        logger.info(
-                            f"[{PROJECT_NAME}] Cache hit! Returning cached result for '{task_name}' | {param_dict}"
-                        )
-                        session.close()
-                        return cached_result
-                    else:
-                        logger.debug(
-                            f"[{PROJECT_NAME}] Task COMPLETED in DB, but no JSON found. "
-                            "Re-running the function."
-                        )
-
-                # 6. Mark the task as RUNNING
-                existing_task.status = TaskStatus.RUNNING
-                if not existing_task.creation_time:
-                    existing_task.creation_time = datetime.utcnow()
-                session.commit()
-                logger.info(
-                    f"[{PROJECT_NAME}] Task '{task_name}' set to RUNNING with params={param_dict}"
-                )
-
-                # 7. Run the actual function
-                start_time = datetime.utcnow()
-                try:
-                    result = func(*args, **kwargs)
-                    end_time = datetime.utcnow()
-                except Exception as e:
-                    # Mark as FAILED
-                    end_time = datetime.utcnow()
-                    existing_task.status = TaskStatus.FAILED
-                    existing_task.completion_time = end_time
-                    existing_task.duration_seconds = int(
-                        (end_time - existing_task.creation_time).total_seconds()
+                    logger.debug(
+                        "[%s] Task COMPLETED in DB, but no output file found. Re-running the function.",
+                        PROJECT_NAME,
                     )
-                    session.commit()
 
-                    err_msg = (
-                        f"[{PROJECT_NAME}] Task '{task_name}' (params={param_dict}) "
-                        f"failed with error: {e}"
+                # 6. Mark a pre-existing task as RUNNING (new records were inserted as RUNNING).
+                #    The marker only matters to callers that skip in-progress tasks, so
+                #    otherwise the terminal update below is the only write.
+                if not created_new and effective_skip_in_progress:
+                    existing_task.status = TaskStatus.RUNNING
+                    if not existing_task.creation_time:
+                        existing_task.creation_time = _utcnow()
+                    session.commit()
+                    logger.info(
+                        "[%s] Task '%s' set to RUNNING with params=%s", PROJECT_NAME, task_name, param_dict
                     )
-                    logger.exception(err_msg)
-                    session.close()
-                    raise TaskFailedError(err_msg) from e
-
-                # 8. Save the result to a JSON file
-                logger.debug(
-                    f"[{PROJECT_NAME}] Function '{task_name}' succeeded. Saving output to JSON."
-                )
-                result_path = output_mgr.save_output(task_name, param_dict, result)
 
-                # 9. Mark COMPLETED in DB
-                existing_task.status = TaskStatus.COMPLETED
-                existing_task.completion_time = end_time
-                existing_task.duration_seconds = int(
-                    (end_time - existing_task.creation_time).total_seconds()
-                )
-                existing_task.result_path = result_path
-                session.commit()
+            logger.debug("[%s] Session closed for '%s'", PROJECT_NAME, task_name)
 
-                logger.info(
-                    f"[{PROJECT_NAME}] Task '{task_name}' completed in "
-                    f"{existing_task.duration_seconds} sec. Result cached at {result_path}"
+            # 7. Run the actual function outside any DB session
+            #    (duration measured with a monotonic clock)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                # Mark as FAILED (committed by the storage worker)
+                duration = time.perf_counter() - start
+                storage_worker.submit(cache_key, {
+                    "status": TaskStatus.FAILED,
+                    "completion_time": _utcnow(),
+                    "duration_seconds": int(duration),
+                })
+                _cache_discard(_result_cache, cache_key)
+
+                err_msg = (
+                    f"[{PROJECT_NAME}] Task '{task_name}' (params={param_dict}) "
+                    f"failed with error: {e}"
                 )
+                logger.exception(err_msg)
+                raise TaskFailedError(err_msg) from e
+            duration = time.perf_counter() - start
+            end_time = _utcnow()
 
-                return result
+            # 8. Save the result to a JSON file
+            logger.debug(
+                "[%s] Function '%s' succeeded. Saving output to JSON.", PROJECT_NAME, task_name
+            )
+            result_path = output_mgr.save_output(task_name, param_dict, result, param_hash)
+            # The file on disk was rewritten; drop any stale in-process copy
+            _cache_discard(_result_cache, cache_key)
+
+            # 9. Mark COMPLETED in DB (committed by the storage worker)
+            storage_worker.submit(cache_key, {
+                "status": TaskStatus.COMPLETED,
+                "completion_time": end_time,
+                "duration_seconds": int(duration),
+                "result_path": result_path,
+            })
+
+            logger.info(
+                "[%s] Task '%s' completed in %d sec. Result cached at %s",
+                PROJECT_NAME, task_name, duration, result_path,
+            )
 
-            finally:
-                session.close()
-                logger.debug(f"[{PROJECT_NAME}] Session closed for '{task_name}'")
+            return result
 
         return wrapper
 
@@ -12,3 +12,10 @@ class TaskFailedError(Exception):
     Raised when the decorated function fails, or the task ends in FAILED state.
     """
     pass
+
+class TaskKeyCollisionError(Exception):
+    """
+    Raised when a stored task has the same parameters_hash as the current call
+    but different parameters (a hash collision).
+    """
+    pass
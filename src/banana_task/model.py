@@ -8,7 +8,10 @@ from sqlalchemy import (
     DateTime,
     BigInteger,
     Enum,
-    CheckConstraint
+    CheckConstraint,
+    Index,
+    JSON,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB  # If you use PostgreSQL
 from sqlalchemy.orm import declarative_base
@@ -21,13 +24,28 @@ class TaskStatus(enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+def _status_index(name: str, status: str) -> Index:
+    """
+    Partial index over the (few) rows in a given status; most rows are COMPLETED.
+    """
+    where = text(f"status = '{status}'")
+    return Index(name, "task_name", sqlite_where=where, postgresql_where=where)
+
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        _status_index("idx_task_running", TaskStatus.RUNNING.name),
+        _status_index("idx_task_failed", TaskStatus.FAILED.name),
+    )
 
-    # Composite primary key: (task_name, serialized_parameters)
+    # Composite primary key: (task_name, parameters_hash).
+    # The PK's unique index is what serves the decorator's per-call lookup.
     task_name = Column(String(255), primary_key=True)
     parameters_hash = Column(String(64), primary_key=True)
-    parameters = Column(JSONB)
+    # Always bound as a dict; JSONB on PostgreSQL, generic JSON elsewhere (e.g. SQLite).
+    # Lookups go through parameters_hash, so this column is never compared in SQL.
+    parameters = Column(JSON().with_variant(JSONB(), "postgresql"))
 
     status = Column(Enum(TaskStatus), nullable=False)
     creation_time = Column(DateTime, nullable=False, default=datetime.utcnow)
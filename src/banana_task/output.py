@@ -1,8 +1,10 @@
 """
 json_output_manager.py
 
-Always store task outputs as a JSON file. The filename is composed of
-(task_name + parameters). No hashes or numeric IDs are used.
+Store task outputs as JSON files. When pyarrow is installed, pandas
+DataFrames are stored as Parquet instead, which is faster to write/read
+and round-trips back to a DataFrame. The filename is composed of the
+sanitized task_name and a BLAKE2b digest of the canonical parameter JSON.
 
 Usage Example:
     manager = JSONOutputManager(output_dir="./results")
@@ -12,9 +14,102 @@ Usage Example:
 
 import os
 import re
+import hashlib
 import json
+import math
+import threading
+import orjson
+import numpy as np
 import pandas as pd
-from typing import Any, Union
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Optional, Tuple, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Rows per Parquet row group when writing DataFrame outputs
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# Marks a "result" holding a DataFrame in pandas' "split" JSON layout
+DATAFRAME_KEY = "__dataframe__"
+
+# numpy arrays/scalars and non-string dict keys are encoded natively
+# instead of falling back to the result's string representation
+RESULT_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Header field marking files whose result was written by the stdlib encoder
+# (NaN/Infinity, ints above 64 bits) and must be read back with it
+ENCODER_KEY = "encoder"
+
+
+def encode_parameters(parameters: dict) -> Tuple[str, str]:
+    """
+    Return the canonical (sorted-key) JSON of `parameters` and its 32-char
+    BLAKE2b digest. The digest is both the parameters_hash the decorator
+    stores in the DB and the key in the output filename.
+
+    The stdlib encoder is used on purpose: unlike orjson it keeps NaN and
+    +/-Infinity distinct from None, and accepts non-string dict keys and
+    ints of any size. Parameters are small, so its speed doesn't matter here.
+    """
+    param_json = json.dumps(parameters, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return param_json, hashlib.blake2b(param_json.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _has_non_finite(value: Any) -> bool:
+    """
+    True if `value` (or anything nested in its dicts/lists/arrays) is a NaN
+    or infinite float.
+    """
+    if isinstance(value, (float, np.floating)):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(v) for v in value)
+    if isinstance(value, np.ndarray) and value.dtype.kind == "f":
+        return not np.isfinite(value).all()
+    return False
+
+
+def _numpy_to_python(value: Any) -> Any:
+    """
+    `default` hook for the stdlib encoder: numpy arrays and scalars, which
+    orjson serializes natively, become lists and Python numbers.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+@lru_cache(maxsize=None)
+def _sanitize_task_name(task_name: str) -> str:
+    """
+    Make `task_name` safe for use in a filename (computed once per task name).
+    """
+    return re.sub(r"[^a-zA-Z0-9_\-]+", "_", task_name)
+
+
+@contextmanager
+def _atomic_target(file_path: str):
+    """
+    Yield a temporary path next to `file_path`. Once the caller has written it,
+    it atomically replaces `file_path`, so readers never see a partial file.
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        JSONOutputManager._remove_if_exists(tmp_path)
+        raise
 
 
 class JSONOutputManager:
@@ -30,108 +125,231 @@ class JSONOutputManager:
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def save_output(self, task_name: str, parameters: dict, result: Any) -> str:
+    def save_output(
+        self, task_name: str, parameters: dict, result: Any, param_hash: Optional[str] = None
+    ) -> str:
         """
         Save the `result` to a JSON file whose name is derived from
         (task_name, parameters). Returns the file path.
+        `param_hash` may pass in the parameters' digest if the caller already has it.
 
         Rules for serialization:
-          - If `result` is a pandas DataFrame, it is converted to a list-of-records JSON.
+          - If `result` is a pandas DataFrame and pyarrow is available, it is
+            written to a Parquet file instead of JSON.
+          - Otherwise a DataFrame is encoded by pandas' JSON writer (split
+            orientation) under a marker key, so it loads back as a DataFrame.
           - If `result` is a dict, list, or primitive, store it directly as JSON.
+            numpy arrays and scalars are stored as lists/numbers, and non-string
+            dict keys are converted to strings. NaN/Infinity and big ints are kept.
           - If `result` references an image/video path (string), store that string as-is.
         """
-        filename = self._make_filename(task_name, parameters)
+        if param_hash is None:
+            _, param_hash = encode_parameters(parameters)
+        filename = self._make_filename(task_name, parameters, param_hash=param_hash)
         file_path = os.path.join(self.output_dir, filename)
 
-        # Convert the result to a JSON-serializable form
-        serializable_result = self._make_json_serializable(result)
+        if HAS_PARQUET:
+            parquet_path = os.path.join(
+                self.output_dir,
+                self._make_filename(task_name, parameters, ".parquet", param_hash=param_hash),
+            )
+            if isinstance(result, pd.DataFrame):
+                try:
+                    self._write_parquet(result, parquet_path)
+                except (ValueError, TypeError, NotImplementedError, pa.ArrowException):
+                    # e.g. non-string column names, mixed-type object columns or
+                    # dtypes Arrow can't store (complex): fall back to JSON below.
+                    self._remove_if_exists(parquet_path)
+                else:
+                    # Don't let an older JSON output for the same key shadow this one
+                    self._remove_if_exists(file_path)
+                    return parquet_path
+            else:
+                self._remove_if_exists(parquet_path)
 
         # Wrap the data in a small structure with additional info if desired
-        content = {
-            "task_name": task_name,
-            "parameters": parameters,
-            "result": serializable_result
-        }
+        header = self._dump_header(task_name, parameters)
+        if isinstance(result, pd.DataFrame):
+            payload = self._dump_dataframe_content(header, result)
+        else:
+            result_json, needs_stdlib = self._dump_result(result)
+            if needs_stdlib:
+                header = header[:-1] + b',"' + ENCODER_KEY.encode("utf-8") + b'":"json"}'
+            payload = b"".join([header[:-1], b',"result":', result_json, b"}"])
 
-        # Write to JSON file (overwrites if it already exists)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(content, f, ensure_ascii=False, indent=2)
+        # Write to JSON file (atomically replaces it if it already exists)
+        with _atomic_target(file_path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
 
         return file_path
 
-    def load_output(self, task_name: str, parameters: dict) -> Union[Any, None]:
+    def load_output(
+        self, task_name: str, parameters: dict, param_hash: Optional[str] = None
+    ) -> Union[Any, None]:
         """
-        Load the result from the JSON file (if it exists) corresponding to
-        (task_name, parameters). Returns the deserialized object, or None if not found.
+        Load the result from the JSON (or Parquet) file, if it exists, corresponding
+        to (task_name, parameters). Returns the deserialized object, or None if not found.
+        `param_hash` may pass in the parameters' digest if the caller already has it.
         """
-        filename = self._make_filename(task_name, parameters)
+        if param_hash is None:
+            _, param_hash = encode_parameters(parameters)
+        if HAS_PARQUET:
+            parquet_path = os.path.join(
+                self.output_dir,
+                self._make_filename(task_name, parameters, ".parquet", param_hash=param_hash),
+            )
+            # Open directly instead of stat-then-open: one syscall, and no race
+            # with a concurrent writer replacing the file in between
+            try:
+                with open(parquet_path, "rb") as f:
+                    return pd.read_parquet(f)
+            except FileNotFoundError:
+                pass
+
+        filename = self._make_filename(task_name, parameters, param_hash=param_hash)
         file_path = os.path.join(self.output_dir, filename)
 
-        if not os.path.exists(file_path):
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
             return None
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = json.load(f)
+        try:
+            content = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            content = None  # e.g. NaN/Infinity literals, which orjson rejects
+        if content is None or content.get(ENCODER_KEY) == "json":
+            content = json.loads(data)
 
         # We have a JSON-serializable structure. Reconstruct special cases if needed.
         raw_result = content.get("result", None)
         return self._restore_from_json(raw_result)
 
-    def _make_filename(self, task_name: str, parameters: dict) -> str:
+    def _make_filename(
+        self,
+        task_name: str,
+        parameters: dict,
+        extension: str = ".json",
+        param_hash: Optional[str] = None,
+    ) -> str:
+        """
+        Create a filename based on (task_name + parameters):
+          - The task name is sanitized for the filesystem and kept for readability,
+          - The parameters are reduced to their encode_parameters() digest
+            (unless `param_hash` already holds it).
+
+        Unlike embedding the parameters themselves, the name has a bounded
+        length, so large parameter sets are neither truncated nor able to collide.
         """
-        Create a filename based on (task_name + parameters).
-        We must ensure the filename is safe for the filesystem:
-          - Serialize `parameters` as JSON,
-          - Remove or replace special characters.
+        if param_hash is None:
+            _, param_hash = encode_parameters(parameters)
+        # Example: train_model__3f1c...9ab2.json
+        return f"{_sanitize_task_name(task_name)}__{param_hash}{extension}"
 
-        Note: Because we do NOT use hashes or numeric IDs, there's a risk
-        of extremely long filenames if `parameters` is large. This is a
-        simplistic approach.
+    @staticmethod
+    def _write_parquet(df: pd.DataFrame, file_path: str) -> None:
+        """
+        Convert `df` to an Arrow table and write it in row groups of
+        PARQUET_ROW_GROUP_SIZE rows. The whole frame is converted up front, so
+        peak memory includes a full Arrow copy of it; the row groups only bound
+        the file's layout, letting readers scan or filter one group at a time.
         """
-        # Convert parameters to a stable JSON string
-        param_str = json.dumps(parameters, sort_keys=True)
-        # Sanitize for filesystem
-        sanitized_params = re.sub(r"[^a-zA-Z0-9_\-]+", "_", param_str)
-        sanitized_task_name = re.sub(r"[^a-zA-Z0-9_\-]+", "_", task_name)
+        table = pa.Table.from_pandas(df)
+        with _atomic_target(file_path) as tmp_path:
+            pq.write_table(
+                table, tmp_path, row_group_size=PARQUET_ROW_GROUP_SIZE, compression="zstd"
+            )
 
-        # Combine the two
-        filename = f"{sanitized_task_name}__{sanitized_params}.json"
-        # Example: train_model__{"epochs"_10_"lr"_0_01_}.json  => train_model____epochs__10__lr__0__01__.json
-        return filename[:255]  # Trim if too long (some filesystems limit length)
+    @staticmethod
+    def _remove_if_exists(file_path: str) -> None:
+        """
+        Delete `file_path` if present (e.g. an output stored in the other format).
+        """
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
 
-    def _make_json_serializable(self, data: Any) -> Any:
+    @staticmethod
+    def _dump_result(result: Any) -> Tuple[bytes, bool]:
         """
-        Convert `data` into a form that can be written as JSON:
-          - If it's a pandas DataFrame, convert to records (list of dicts).
-          - If it's a dict/list/primitive, return as-is (assuming it's already JSON-friendly).
-          - If it's a string referencing an image or video, store as-is.
-          - Otherwise, attempt best-effort conversion or raise an error.
+        Encode a non-DataFrame result, returning (bytes, needs_stdlib).
+
+        orjson is used whenever it represents the value faithfully. It writes
+        NaN/+-inf as null and rejects ints above 64 bits, so such results go
+        through the stdlib encoder instead (needs_stdlib=True). A result
+        neither can encode is stored as its string representation.
         """
-        if isinstance(data, pd.DataFrame):
-            # Convert DataFrame to a list of row dicts
-            return data.to_dict(orient="records")
+        try:
+            encoded = orjson.dumps(result, option=RESULT_JSON_OPTIONS)
+        except TypeError:
+            encoded = None
+        # orjson writes non-finite floats as null: only then is the walk needed
+        if encoded is not None and not (b"null" in encoded and _has_non_finite(result)):
+            return encoded, False
+
+        try:
+            return json.dumps(result, ensure_ascii=False, default=_numpy_to_python).encode("utf-8"), True
+        except (TypeError, ValueError):
+            # Not natively serializable: store its string representation instead
+            return orjson.dumps(str(result)), False
 
-        # If it's a dict, list, int, float, bool, or string,
-        # it's usually JSON-serializable by default, unless it contains nested objects.
-        # We'll do a simple test dump to catch errors:
+    @staticmethod
+    def _dump_header(task_name: str, parameters: dict) -> bytes:
+        """
+        Encode the informational part of an output file as a JSON object.
+        Parameters orjson can't represent (e.g. ints above 64 bits) are kept
+        as their canonical JSON text instead.
+        """
         try:
-            json.dumps(data)  # Test if it's already serializable
-            return data
+            return orjson.dumps(
+                {"task_name": task_name, "parameters": parameters}, option=RESULT_JSON_OPTIONS
+            )
         except TypeError:
-            # If it's not natively serializable, represent it as a string fallback
-            return str(data)
+            param_json, _ = encode_parameters(parameters)
+            return orjson.dumps({"task_name": task_name, "parameters": param_json})
+
+    @staticmethod
+    def _dump_dataframe_content(header: bytes, df: pd.DataFrame) -> bytes:
+        """
+        Build the JSON file content for a DataFrame result after `header`.
+        pandas' C writer encodes the frame column-wise; its output is spliced in
+        verbatim rather than materializing one dict per row and re-encoding them.
+        """
+        frame_json = df.to_json(orient="split", date_format="iso").encode("utf-8")
+        return b"".join([
+            header[:-1],
+            b',"result":{"', DATAFRAME_KEY.encode("utf-8"), b'":', frame_json, b"}}",
+        ])
 
     def _restore_from_json(self, raw_result: Any) -> Any:
         """
-        Reverse part of the _make_json_serializable logic if needed.
-        Here we do minimal re-construction. For example, if we see
-        a list of dicts, it might have come from a DataFrame,
-        but we can't automatically re-infer that it should be a DataFrame
-        unless we store extra metadata.
+        Reverse the special cases of save_output. A result stored under the
+        DATAFRAME_KEY marker is rebuilt as a DataFrame (columns and index
+        included). The split layout doesn't record dtypes or index/column
+        names, so those are not restored: e.g. datetimes come back as ISO
+        strings. Anything else is returned as loaded.
 
         For images/videos (paths), we stored them as strings, so we just return the string.
         """
-        # This method is minimal. If you want to automatically
-        # convert lists-of-dicts back to DataFrames, you need extra markers
-        # in _make_json_serializable (e.g., store a special key).
+        if isinstance(raw_result, dict) and raw_result.keys() == {DATAFRAME_KEY}:
+            frame = raw_result[DATAFRAME_KEY]
+            return pd.DataFrame(
+                frame["data"],
+                index=self._labels_from_split(frame["index"]),
+                columns=self._labels_from_split(frame["columns"]),
+            )
         return raw_result
+
+    @staticmethod
+    def _labels_from_split(labels: list) -> Union[list, pd.MultiIndex]:
+        """
+        The "split" layout writes each MultiIndex label as a list (one entry per
+        level). Passed to the DataFrame constructor as-is, those would be read
+        as level arrays, i.e. transposed, so rebuild them from tuples instead.
+        """
+        if labels and all(isinstance(label, list) for label in labels):
+            return pd.MultiIndex.from_tuples([tuple(label) for label in labels])
+        return labels
@@ -0,0 +1,169 @@
+"""
+worker.py
+
+Background writer for task status updates. The decorator enqueues terminal
+transitions (COMPLETED / FAILED) instead of committing them on the caller's
+thread; a single daemon thread drains the queue and applies each batch of
+updates in one transaction, retrying batches that fail.
+
+Usage Example:
+    worker = StorageWorker(SessionFactory)
+    worker.start()
+    worker.submit(("train_model", param_hash), {"status": TaskStatus.COMPLETED})
+    worker.flush()  # block until everything submitted so far is committed
+"""
+
+import logging
+import queue
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Optional
+
+from sqlalchemy import bindparam, update
+
+from .model import Task
+
+logger = logging.getLogger("banana_task")
+
+
+@lru_cache(maxsize=None)
+def _update_statement(columns: tuple):
+    """
+    UPDATE of the given Task columns by primary key, with every value bound as
+    a parameter. Built once per column set and reused for executemany batches.
+    """
+    table = Task.__table__
+    return (
+        update(Task)
+        .where(
+            Task.task_name == bindparam("pk_task_name"),
+            Task.parameters_hash == bindparam("pk_parameters_hash"),
+        )
+        .values({name: bindparam(f"v_{name}", type_=table.c[name].type) for name in columns})
+    )
+
+
+class StorageWorker(threading.Thread):
+    """
+    A daemon thread that applies queued task updates in batches.
+    Keys are (task_name, parameters_hash) tuples, i.e. the Task primary key.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+    ):
+        """
+        :param session_factory: sessionmaker used to open one session per batch.
+        :param batch_size: Maximum number of updates applied in one transaction.
+        :param flush_interval: Seconds to wait for more updates before committing a batch.
+        :param max_retries: Attempts at committing a batch before falling back to
+            committing its updates one by one.
+        :param retry_delay: Seconds to wait after the first failed attempt (doubled each time).
+        """
+        super().__init__(name="banana-task-storage", daemon=True)
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.SimpleQueue()
+        self._cond = threading.Condition()
+        self._pending: Dict[Hashable, int] = {}
+        self._unfinished = 0
+
+    def submit(self, key: Hashable, values: Dict[str, Any]) -> None:
+        """
+        Enqueue an update of the Task identified by `key`. Returns immediately.
+        """
+        with self._cond:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._unfinished += 1
+        self._queue.put((key, values))
+
+    def has_pending(self, key: Hashable) -> bool:
+        """
+        True if updates for `key` were submitted but are not committed yet.
+        """
+        with self._cond:
+            return key in self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every update submitted so far has been applied.
+        Returns False if `timeout` expired first.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+
+            try:
+                self._apply_with_retry(batch)
+            finally:
+                with self._cond:
+                    for key, _ in batch:
+                        self._pending[key] -= 1
+                        if not self._pending[key]:
+                            del self._pending[key]
+                    self._unfinished -= len(batch)
+                    self._cond.notify_all()
+
+    def _apply_with_retry(self, batch) -> None:
+        """
+        Apply `batch`, retrying failures (e.g. a locked or briefly unreachable DB)
+        with exponential backoff. If it keeps failing, commit its updates one per
+        transaction so a single bad update can't take the others down with it;
+        only updates that fail on their own are dropped, and logged.
+        """
+        for attempt in range(self.max_retries):
+            try:
+                self._apply(batch)
+                return
+            except Exception:
+                logger.warning(
+                    "Applying %d queued task update(s) failed (attempt %d/%d).",
+                    len(batch), attempt + 1, self.max_retries, exc_info=True,
+                )
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+        for key, values in batch:
+            try:
+                self._apply([(key, values)])
+            except Exception:
+                logger.exception("Dropping queued update of task %s: %s", key, values)
+
+    def _apply(self, batch) -> None:
+        """
+        Apply the updates in submission order within a single transaction.
+        Consecutive updates of the same columns go out as one executemany.
+        """
+        runs = []  # [(columns, [params, ...]), ...]
+        for (task_name, param_hash), values in batch:
+            columns = tuple(sorted(values))
+            params = {f"v_{name}": value for name, value in values.items()}
+            params["pk_task_name"] = task_name
+            params["pk_parameters_hash"] = param_hash
+            if runs and runs[-1][0] == columns:
+                runs[-1][1].append(params)
+            else:
+                runs.append((columns, [params]))
+
+        with self.session_factory.begin() as session:
+            # Executed at Core level: ORM-enabled bulk UPDATEs with WHERE criteria
+            # are rejected by SQLAlchemy 2.x, and nothing here is ORM-loaded anyway
+            connection = session.connection()
+            for columns, params in runs:
+                connection.execute(_update_statement(columns), params)